@@ -5,17 +5,37 @@ Based on https://github.com/Tongyi-MAI/MAI-UI/tree/main/src
 """
 
 import re
+import time
+import asyncio
 import base64
 from io import BytesIO
 from typing import Optional, Tuple, Dict, Any, List
 from dataclasses import dataclass, field
 from PIL import Image
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+
+from device import UIHierarchy
+from imaging import ImageExecutor
 
 
 # Scale factor for coordinate normalization (MAI-UI uses 999)
 SCALE_FACTOR = 999
 
+# Minimum accessibility-tree match confidence to skip the model in ground()
+TREE_CONFIDENCE_THRESHOLD = 0.8
+
+# Words stripped from grounding instructions to get the target label
+_CLICK_VERBS = ("click", "tap", "press", "select")
+_INSTRUCTION_VERBS = _CLICK_VERBS + ("open", "choose", "find", "on")
+_INSTRUCTION_ARTICLES = ("the", "a", "an")
+_INSTRUCTION_NOUNS = ("button", "option", "tab", "icon", "item", "link", "menu", "entry")
+
+# Longest unquoted target accepted by is_click_instruction()
+MAX_CLICK_TARGET_WORDS = 4
+
+_QUOTED_RE = re.compile(r'["\u201c\u2018](.+?)["\u201d\u2019]')
+_MULTI_STEP_RE = re.compile(r'\b(?:then|and|after|before)\b|[,;\uff0c\uff1b\u3002]', re.IGNORECASE)
+
 
 @dataclass
 class TrajStep:
@@ -34,6 +54,53 @@ class TrajMemory:
     steps: List[TrajStep] = field(default_factory=list)
 
 
+@dataclass
+class GroundingStats:
+    """
+    Accessibility-tree fast path statistics.
+
+    tree_hits/model_calls count ground() answers from the tree and from the
+    model; tree_time includes any hierarchy dump the caller waited for.
+    model_latency/model_samples keep a running average over every model
+    call (ground and predict), which prices each avoided call.
+    """
+    tree_hits: int = 0
+    model_calls: int = 0
+    tree_time: float = 0.0
+    model_latency: float = 0.0
+    model_samples: int = 0
+    clicks_snapped: int = 0
+
+    def record_model(self, seconds: float) -> None:
+        self.model_latency += seconds
+        self.model_samples += 1
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.tree_hits + self.model_calls
+        return self.tree_hits / total if total else 0.0
+
+    @property
+    def latency_saved(self) -> float:
+        """
+        Estimated seconds saved: each tree hit avoided an average model call,
+        minus time spent on tree lookups and the dumps they waited for.
+        """
+        if not self.model_samples:
+            return 0.0
+        avg_model = self.model_latency / self.model_samples
+        return self.tree_hits * avg_model - self.tree_time
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "tree_hits": self.tree_hits,
+            "model_calls": self.model_calls,
+            "hit_rate": round(self.hit_rate, 3),
+            "latency_saved": round(self.latency_saved, 3),
+            "clicks_snapped": self.clicks_snapped,
+        }
+
+
 # System prompts
 GROUNDING_PROMPT = """You are a GUI grounding agent. Given a screenshot and an instruction, identify the UI element and return its coordinates.
 
@@ -89,6 +156,96 @@ def parse_coordinates(text: str) -> Optional[Tuple[float, float]]:
     return None
 
 
+def is_click_instruction(instruction: str) -> bool:
+    """Whether instruction asks to click a single element, like: Click WiFi"""
+    words = instruction.strip().lower().split()
+    if len(words) < 2 or words[0] not in _CLICK_VERBS:
+        return False
+    # A quoted label is unambiguous; otherwise reject multi-step goals
+    if _QUOTED_RE.search(instruction):
+        return True
+    if _MULTI_STEP_RE.search(instruction):
+        return False
+    return len(grounding_target(instruction).split()) <= MAX_CLICK_TARGET_WORDS
+
+
+def grounding_target(instruction: str) -> str:
+    """Extract the element label from a grounding instruction"""
+    quoted = _QUOTED_RE.search(instruction)
+    if quoted:
+        return quoted.group(1).strip()
+
+    words = instruction.strip().rstrip(".!?").split()
+    while words and words[0].lower() in _INSTRUCTION_VERBS + _INSTRUCTION_ARTICLES:
+        words = words[1:]
+    while words and words[-1].lower() in _INSTRUCTION_NOUNS:
+        words = words[:-1]
+    return " ".join(words)
+
+
+def match_hierarchy(
+    instruction: str,
+    hierarchy: UIHierarchy
+) -> Tuple[Optional[Tuple[float, float]], float]:
+    """
+    Resolve a grounding instruction against the accessibility tree.
+
+    Confidence rule:
+    - a single exact label match scores 1.0
+    - several exact matches of which exactly one is clickable score 0.9
+    - otherwise a single best partial match scores len(target) / len(label)
+    - ambiguous matches (ties between different elements) score 0
+
+    Returns:
+        (normalized coordinates or None, confidence)
+    """
+    target = grounding_target(instruction)
+    if not target:
+        return None, 0.0
+
+    exact = hierarchy.lookup(target)
+    if len(exact) == 1:
+        return hierarchy.normalized_center(exact[0]), 1.0
+    if exact:
+        clickable = [node for node in exact if node.clickable]
+        if len(clickable) == 1:
+            return hierarchy.normalized_center(clickable[0]), 0.9
+        return None, 0.0
+
+    partial = hierarchy.search(target)
+    if not partial:
+        return None, 0.0
+    needle_len = len(" ".join(target.lower().split()))
+    scored = sorted(
+        ((needle_len / len(label), node) for label, node in partial),
+        key=lambda item: item[0],
+        reverse=True,
+    )
+    best_score, best_node = scored[0]
+    if len(scored) > 1 and scored[1][0] == best_score and scored[1][1].bounds != best_node.bounds:
+        return None, 0.0
+    return hierarchy.normalized_center(best_node), best_score
+
+
+def snap_to_hierarchy(
+    coords: Tuple[float, float],
+    hierarchy: UIHierarchy
+) -> Optional[Tuple[float, float]]:
+    """Center of the smallest clickable element containing normalized coords"""
+    w, h = hierarchy.screen_size
+    x, y = coords[0] * w, coords[1] * h
+    hits = [
+        node for node in hierarchy.nodes
+        if node.clickable
+        and node.bounds[0] <= x < node.bounds[2]
+        and node.bounds[1] <= y < node.bounds[3]
+    ]
+    if not hits:
+        return None
+    node = min(hits, key=lambda n: (n.bounds[2] - n.bounds[0]) * (n.bounds[3] - n.bounds[1]))
+    return hierarchy.normalized_center(node)
+
+
 def parse_action(text: str) -> Dict[str, Any]:
     """Parse action from model response"""
     action = {"action": "wait", "raw": text}
@@ -158,17 +315,30 @@ class MAIAgent:
         history_n: int = 3,
         temperature: float = 0.0,
         max_tokens: int = 2048,
+        image_executor: Optional[ImageExecutor] = None,
+        grounding_stats: Optional[GroundingStats] = None,
     ):
         self.client = OpenAI(
             base_url=llm_base_url,
             api_key="not-needed"
         )
+        self.async_client = AsyncOpenAI(
+            base_url=llm_base_url,
+            api_key="not-needed"
+        )
         self.model_name = model_name
         self.history_n = history_n
         self.temperature = temperature
         self.max_tokens = max_tokens
+        self.image_executor = image_executor
 
         self.memory = TrajMemory()
+        self.grounding_stats = grounding_stats or GroundingStats()
+
+    async def close(self) -> None:
+        """Close the model API clients"""
+        self.client.close()
+        await self.async_client.close()
 
     def reset(self, goal: str = "", task_id: str = "") -> None:
         """Reset agent for new task"""
@@ -191,6 +361,14 @@ class MAIAgent:
                 if step.image_pil:
                     history_images.append(step.image_pil)
 
+        # Encode all images up front so an executor can work on them in parallel
+        images = history_images + [image]
+        if self.image_executor:
+            futures = [self.image_executor.submit_encode(img) for img in images]
+            encoded = [future.result() for future in futures]
+        else:
+            encoded = [pil_to_base64(img) for img in images]
+
         # Build user message with images
         content = []
 
@@ -209,11 +387,11 @@ class MAIAgent:
                 "type": "text",
                 "text": f"\n[Previous {len(history_images)} screenshots for context]"
             })
-            for hist_img in history_images:
+            for hist_b64 in encoded[:-1]:
                 content.append({
                     "type": "image_url",
                     "image_url": {
-                        "url": f"data:image/png;base64,{pil_to_base64(hist_img)}"
+                        "url": f"data:image/png;base64,{hist_b64}"
                     }
                 })
 
@@ -222,7 +400,7 @@ class MAIAgent:
         content.append({
             "type": "image_url",
             "image_url": {
-                "url": f"data:image/png;base64,{pil_to_base64(image)}"
+                "url": f"data:image/png;base64,{encoded[-1]}"
             }
         })
 
@@ -244,8 +422,25 @@ class MAIAgent:
         Returns:
             (raw_response, parsed_action)
         """
+        prediction, action = self.propose(instruction, image)
+        if action.get("action") != "error":
+            self.commit(image, prediction, action)
+        return prediction, action
+
+    def propose(
+        self,
+        instruction: str,
+        image: Image.Image
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Like predict(), but without saving the step to memory.
+
+        Used for speculative predictions that may be discarded; call
+        commit() to keep the result.
+        """
         messages = self._build_messages(instruction, image, NAVIGATION_PROMPT)
 
+        start = time.perf_counter()
         try:
             response = self.client.chat.completions.create(
                 model=self.model_name,
@@ -257,11 +452,45 @@ class MAIAgent:
         except Exception as e:
             prediction = f"Error: {str(e)}"
             return prediction, {"action": "error", "message": str(e)}
+        self.grounding_stats.record_model(time.perf_counter() - start)
+
+        return prediction, parse_action(prediction)
+
+    async def propose_async(
+        self,
+        instruction: str,
+        image: Image.Image
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Async propose(). Cancelling the awaiting task aborts the HTTP request.
+        """
+        messages = await asyncio.to_thread(
+            self._build_messages, instruction, image, NAVIGATION_PROMPT
+        )
+
+        start = time.perf_counter()
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+            )
+            prediction = response.choices[0].message.content
+        except Exception as e:
+            prediction = f"Error: {str(e)}"
+            return prediction, {"action": "error", "message": str(e)}
+        self.grounding_stats.record_model(time.perf_counter() - start)
 
-        # Parse action
-        action = parse_action(prediction)
+        return prediction, parse_action(prediction)
 
-        # Save to memory
+    def commit(
+        self,
+        image: Image.Image,
+        prediction: str,
+        action: Dict[str, Any]
+    ) -> None:
+        """Save a predicted step to trajectory memory"""
         step = TrajStep(
             image_pil=image.copy(),
             prediction=prediction,
@@ -270,25 +499,40 @@ class MAIAgent:
         )
         self.memory.steps.append(step)
 
-        return prediction, action
-
     def ground(
         self,
         instruction: str,
-        image: Image.Image
+        image: Image.Image,
+        hierarchy: Optional[UIHierarchy] = None
     ) -> Tuple[str, Optional[Tuple[float, float]]]:
         """
         Ground UI element - find coordinates for instruction.
 
+        If a view hierarchy is given it is consulted first, and the model is
+        only called when the match confidence is below
+        TREE_CONFIDENCE_THRESHOLD.
+
         Args:
             instruction: What element to find
             image: Screenshot
+            hierarchy: Accessibility tree of the same screen (optional)
 
         Returns:
             (raw_response, coordinates or None)
         """
+        if hierarchy is not None:
+            start = time.perf_counter()
+            coords, confidence = match_hierarchy(instruction, hierarchy)
+            self.grounding_stats.tree_time += time.perf_counter() - start
+            if coords and confidence >= TREE_CONFIDENCE_THRESHOLD:
+                self.grounding_stats.tree_hits += 1
+                x = round(coords[0] * SCALE_FACTOR)
+                y = round(coords[1] * SCALE_FACTOR)
+                return f"<answer>click({x}, {y})</answer>", coords
+
         messages = self._build_messages(instruction, image, GROUNDING_PROMPT)
 
+        start = time.perf_counter()
         try:
             response = self.client.chat.completions.create(
                 model=self.model_name,
@@ -299,10 +543,26 @@ class MAIAgent:
             prediction = response.choices[0].message.content
         except Exception as e:
             return f"Error: {str(e)}", None
+        finally:
+            self.grounding_stats.model_calls += 1
+        self.grounding_stats.record_model(time.perf_counter() - start)
 
         coords = parse_coordinates(prediction)
         return prediction, coords
 
+    def refine_click(
+        self,
+        action: Dict[str, Any],
+        hierarchy: Optional[UIHierarchy]
+    ) -> None:
+        """Move a click action onto the center of the element it hits"""
+        if hierarchy is None or action.get("action") != "click":
+            return
+        coords = snap_to_hierarchy(tuple(action["coordinates"]), hierarchy)
+        if coords:
+            action["coordinates"] = list(coords)
+            self.grounding_stats.clicks_snapped += 1
+
     @property
     def trajectory(self) -> List[Dict[str, Any]]:
         """Get trajectory as list of dicts"""
@@ -2,12 +2,24 @@
 ADB Device Controller for Android GUI Automation
 """
 
+import re
+import hashlib
 import subprocess
 import asyncio
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
 from PIL import Image
 from io import BytesIO
-from typing import Optional, Tuple
-from dataclasses import dataclass
+from typing import Optional, Tuple, List, Dict
+from dataclasses import dataclass, field
+
+from imaging import ImageExecutor
+
+
+# Number of parsed view hierarchies kept per controller
+HIERARCHY_CACHE_SIZE = 8
+
+_BOUNDS_RE = re.compile(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]')
 
 
 @dataclass
@@ -18,13 +30,104 @@ class DeviceInfo:
     screen_height: int
 
 
+@dataclass
+class UINode:
+    """Single view from the accessibility tree"""
+    text: str
+    resource_id: str
+    content_desc: str
+    bounds: Tuple[int, int, int, int]
+    clickable: bool = False
+
+    @property
+    def center(self) -> Tuple[int, int]:
+        x1, y1, x2, y2 = self.bounds
+        return ((x1 + x2) // 2, (y1 + y2) // 2)
+
+
+def _normalize_label(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+@dataclass
+class UIHierarchy:
+    """
+    Parsed `uiautomator dump`, indexed by label.
+
+    Labels are text, content-desc and the short resource-id (the part after
+    ":id/"), all lowercased with collapsed whitespace.
+    """
+    screen_size: Tuple[int, int]
+    nodes: List[UINode] = field(default_factory=list)
+    index: Dict[str, List[UINode]] = field(default_factory=dict)
+
+    @classmethod
+    def from_xml(cls, xml: str, screen_size: Tuple[int, int]) -> "UIHierarchy":
+        hierarchy = cls(screen_size=screen_size)
+        root = ET.fromstring(xml)
+        for el in root.iter("node"):
+            match = _BOUNDS_RE.match(el.get("bounds", ""))
+            if not match:
+                continue
+            bounds = tuple(int(v) for v in match.groups())
+            if bounds[2] <= bounds[0] or bounds[3] <= bounds[1]:
+                continue
+            node = UINode(
+                text=el.get("text", ""),
+                resource_id=el.get("resource-id", ""),
+                content_desc=el.get("content-desc", ""),
+                bounds=bounds,
+                clickable=el.get("clickable") == "true",
+            )
+            hierarchy.nodes.append(node)
+            labels = (node.text, node.content_desc, node.resource_id.split(":id/")[-1])
+            # Normalize before deduplicating so a node whose text and id
+            # agree is indexed once under that key
+            for key in {_normalize_label(label) for label in labels}:
+                if key:
+                    hierarchy.index.setdefault(key, []).append(node)
+        return hierarchy
+
+    def lookup(self, label: str) -> List[UINode]:
+        """Nodes whose text, content-desc or resource-id equals label"""
+        return self.index.get(_normalize_label(label), [])
+
+    def search(self, label: str) -> List[Tuple[str, UINode]]:
+        """Nodes with a label containing `label`, as (matched_label, node)"""
+        needle = _normalize_label(label)
+        if not needle:
+            return []
+        return [
+            (key, node)
+            for key, nodes in self.index.items() if needle in key
+            for node in nodes
+        ]
+
+    def normalized_center(self, node: UINode) -> Tuple[float, float]:
+        """Node center as normalized (0-1) screen coordinates"""
+        cx, cy = node.center
+        w, h = self.screen_size
+        return (min(max(cx / w, 0), 1), min(max(cy / h, 0), 1))
+
+
+def frame_hash(image: Image.Image) -> bytes:
+    """Exact content hash of a screenshot"""
+    return hashlib.blake2b(image.tobytes(), digest_size=16).digest()
+
+
 class ADBController:
     """Android device controller via ADB"""
 
-    def __init__(self, device_id: Optional[str] = None):
+    def __init__(
+        self,
+        device_id: Optional[str] = None,
+        image_executor: Optional[ImageExecutor] = None,
+    ):
         self.device_id = device_id
+        self.image_executor = image_executor
         self.screen_size: Tuple[int, int] = (1080, 2400)
         self.device_info: Optional[DeviceInfo] = None
+        self._hierarchy_cache: "OrderedDict[bytes, UIHierarchy]" = OrderedDict()
 
     def _adb(self, *args) -> subprocess.CompletedProcess:
         cmd = ["adb"]
@@ -76,6 +179,8 @@ class ADBController:
     async def screenshot(self) -> Image.Image:
         """Capture screenshot"""
         raw = self._adb_raw("exec-out", "screencap", "-p")
+        if self.image_executor:
+            return await self.image_executor.decode(raw)
         return Image.open(BytesIO(raw))
 
     async def screenshot_base64(self) -> str:
@@ -84,6 +189,38 @@ class ADBController:
         raw = self._adb_raw("exec-out", "screencap", "-p")
         return base64.b64encode(raw).decode('utf-8')
 
+    async def dump_hierarchy(self) -> Optional[UIHierarchy]:
+        """Dump and parse the current view hierarchy via uiautomator"""
+        # uiautomator takes seconds; keep it off the event loop
+        result = await asyncio.to_thread(self._adb, "exec-out", "uiautomator", "dump", "/dev/tty")
+        out = result.stdout
+        end = out.rfind("</hierarchy>")
+        start = out.find("<?xml")
+        if start < 0:
+            start = out.find("<hierarchy")
+        if start < 0 or end < 0:
+            return None
+        xml = out[start:end + len("</hierarchy>")]
+        try:
+            return UIHierarchy.from_xml(xml, self.screen_size)
+        except ET.ParseError:
+            return None
+
+    async def ui_hierarchy(self, image: Image.Image) -> Optional[UIHierarchy]:
+        """View hierarchy for the screen shown in image, cached by frame content"""
+        key = frame_hash(image)
+        if key in self._hierarchy_cache:
+            self._hierarchy_cache.move_to_end(key)
+            return self._hierarchy_cache[key]
+
+        hierarchy = await self.dump_hierarchy()
+        if hierarchy is None:
+            return None
+        self._hierarchy_cache[key] = hierarchy
+        if len(self._hierarchy_cache) > HIERARCHY_CACHE_SIZE:
+            self._hierarchy_cache.popitem(last=False)
+        return hierarchy
+
     async def tap(self, x: float, y: float) -> None:
         """Tap at normalized coordinates (0-1)"""
         abs_x = int(x * self.screen_size[0])
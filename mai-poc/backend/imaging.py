@@ -0,0 +1,201 @@
+"""
+Image codec executor
+
+PNG decode/encode and base64 run in a process pool so codec work scales
+across cores instead of holding the GIL on the event loop thread. Frames
+travel through multiprocessing.shared_memory buffers; only small metadata
+and the compressed results are pickled.
+"""
+
+import os
+import asyncio
+import multiprocessing
+import base64
+from io import BytesIO
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+from PIL import Image
+
+
+# Modes passed through unchanged; anything else is converted to RGBA
+_RAW_MODES = ("RGB", "RGBA", "L")
+
+
+def _decode_png(src_name: str, src_len: int, dst_name: str, mode: str) -> None:
+    """Worker: decode PNG bytes from src into raw pixels in dst"""
+    src = shared_memory.SharedMemory(name=src_name)
+    dst = shared_memory.SharedMemory(name=dst_name)
+    try:
+        image = Image.open(BytesIO(src.buf[:src_len]))
+        if image.mode != mode:
+            image = image.convert(mode)
+        raw = image.tobytes()
+        dst.buf[:len(raw)] = raw
+        del image
+    finally:
+        src.close()
+        dst.close()
+
+
+def _encode_png_base64(src_name: str, mode: str, size: Tuple[int, int]) -> str:
+    """Worker: encode raw pixels from src as base64 PNG"""
+    src = shared_memory.SharedMemory(name=src_name)
+    image = None
+    try:
+        image = Image.frombuffer(mode, size, src.buf, "raw", mode, 0, 1)
+        buffer = BytesIO()
+        image.save(buffer, format='PNG')
+    finally:
+        # The image may map src.buf; drop it first or close() fails
+        del image
+        src.close()
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+class ImageExecutor:
+    """
+    Process pool for image codec work.
+
+    With max_workers=0 everything runs inline in the calling thread, which
+    is useful for debugging and single-device setups.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        self.max_workers = max_workers
+        self._pool = None
+        if max_workers > 0:
+            # Workers start lazily, after the server has threads; forking a
+            # threaded process can deadlock, so use a forkserver instead
+            self._pool = ProcessPoolExecutor(
+                max_workers, mp_context=multiprocessing.get_context("forkserver")
+            )
+
+    def submit_decode(self, png: bytes) -> "Future[Image.Image]":
+        """Decode PNG bytes in a worker, returns a Future of the image"""
+        if self._pool is None:
+            return _completed(lambda: Image.open(BytesIO(png)))
+
+        # Reading the header is cheap and tells us the output buffer size
+        header = Image.open(BytesIO(png))
+        size = header.size
+        mode = header.mode if header.mode in _RAW_MODES else "RGBA"
+        src = _create_shm(len(png))
+        nbytes = size[0] * size[1] * Image.getmodebands(mode)
+        dst = _create_shm(nbytes)
+        src.buf[:len(png)] = png
+
+        def collect(f: Future) -> Image.Image:
+            try:
+                f.result()
+                with dst.buf[:nbytes] as pixels:
+                    return Image.frombytes(mode, size, pixels)
+            finally:
+                _release(src, dst)
+
+        try:
+            future = self._pool.submit(_decode_png, src.name, len(png), dst.name, mode)
+        except Exception:
+            _release(src, dst)
+            raise
+        return _chain(future, collect)
+
+    def submit_encode(self, image: Image.Image) -> "Future[str]":
+        """Encode image as base64 PNG in a worker, returns a Future of the string"""
+        if self._pool is None:
+            return _completed(lambda: _encode_inline(image))
+
+        if image.mode not in _RAW_MODES:
+            image = image.convert("RGBA")
+        src = _create_shm(image.size[0] * image.size[1] * Image.getmodebands(image.mode))
+        try:
+            _write_raw(image, src.buf)
+            future = self._pool.submit(_encode_png_base64, src.name, image.mode, image.size)
+        except Exception:
+            _release(src)
+            raise
+        return _chain(future, lambda f: _finish(f, src))
+
+    async def decode(self, png: bytes) -> Image.Image:
+        """Decode PNG bytes without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit_decode(png))
+
+    async def encode_base64(self, image: Image.Image) -> str:
+        """Encode image as base64 PNG without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit_encode(image))
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _write_raw(image: Image.Image, buf: memoryview) -> None:
+    """Write raw pixels straight into buf (Image.tobytes() without the join)"""
+    image.load()
+    encoder = Image._getencoder(image.mode, "raw", image.mode)
+    encoder.setimage(image.im, (0, 0) + image.size)
+    offset = 0
+    chunk = max(65536, image.size[0] * 4)
+    while True:
+        _, errcode, data = encoder.encode(chunk)
+        buf[offset:offset + len(data)] = data
+        offset += len(data)
+        if errcode:
+            break
+    if errcode < 0:
+        raise RuntimeError(f"raw encoder error {errcode}")
+
+
+def _encode_inline(image: Image.Image) -> str:
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+def _create_shm(size: int) -> shared_memory.SharedMemory:
+    return shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+
+def _release(*blocks: shared_memory.SharedMemory) -> None:
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+def _finish(future: Future, src: shared_memory.SharedMemory) -> str:
+    try:
+        return future.result()
+    finally:
+        _release(src)
+
+
+def _completed(fn) -> Future:
+    future: Future = Future()
+    try:
+        future.set_result(fn())
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def _chain(future: Future, collect) -> Future:
+    """Future resolving to collect(future) once the worker is done"""
+    result: Future = Future()
+
+    def done(f: Future) -> None:
+        try:
+            if f.cancelled():
+                result.cancel()
+            value = collect(f)
+        except BaseException as e:
+            if not result.done():
+                result.set_exception(e)
+        else:
+            if not result.done():
+                result.set_result(value)
+
+    future.add_done_callback(done)
+    return result
@@ -5,33 +5,69 @@ Simple FastAPI server with WebSocket for real-time GUI automation.
 No database - results stored in memory and sent to frontend.
 """
 
+import os
+import time
 import asyncio
 import uuid
 import base64
 from io import BytesIO
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 from contextlib import asynccontextmanager
+from dataclasses import dataclass
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
 
+from PIL import ImageChops
+
 from device import ADBController
-from agent import MAIAgent
+from agent import MAIAgent, GroundingStats, is_click_instruction
+from imaging import ImageExecutor
+from preview import PreviewEncoder, tile_grid
+
+
+# Image codec worker processes (0 = decode/encode inline on the event loop)
+IMAGE_WORKERS = int(os.environ.get("MAI_IMAGE_WORKERS", os.cpu_count() or 1))
+
+# Seconds to wait for the UI to settle after an action
+SETTLE_DELAY = 1.5
 
+# Speculative mode: seconds after the action to grab the early frame
+SPECULATION_DELAY = 0.3
+
+# Speculative mode frame matching (see frames_match). The status bar is
+# ignored; elsewhere any 32px tile with a real change is a miss, so a toggled
+# switch or a typed character still rejects the prediction. A tile counts as
+# changed when more than SPECULATION_NOISE_PIXELS pixels differ by more than
+# SPECULATION_PIXEL_TOLERANCE gray levels, and the changed area is wider than
+# a blinking text cursor
+SPECULATION_STATUS_BAR = 0.04
+SPECULATION_TILE = 32
+SPECULATION_PIXEL_TOLERANCE = 24
+SPECULATION_NOISE_PIXELS = 16
+SPECULATION_CURSOR_WIDTH = 8
 
 # In-memory storage
 results: List[Dict[str, Any]] = []
 current_task: Dict[str, Any] = {}
+image_executor: Optional[ImageExecutor] = None
+
+# Shared across tasks so the hierarchy cache and grounding stats accumulate
+adb_controller: Optional[ADBController] = None
+grounding_stats = GroundingStats()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """App lifespan handler"""
+    global image_executor
     print("Starting MAI-UI POC Server...")
+    image_executor = ImageExecutor(IMAGE_WORKERS)
     yield
     print("Shutting down...")
+    image_executor.shutdown()
 
 
 app = FastAPI(title="MAI-UI POC", lifespan=lifespan)
@@ -40,6 +76,27 @@ app = FastAPI(title="MAI-UI POC", lifespan=lifespan)
 class TaskRequest(BaseModel):
     instruction: str
     max_steps: int = 10
+    speculative: bool = False
+
+
+@dataclass
+class SpeculationStats:
+    """Speculative next-step prediction statistics"""
+    attempts: int = 0
+    hits: int = 0
+    latency_saved: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.attempts if self.attempts else 0.0
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "attempts": self.attempts,
+            "hits": self.hits,
+            "hit_rate": round(self.hit_rate, 3),
+            "latency_saved": round(self.latency_saved, 3),
+        }
 
 
 class ConnectionManager:
@@ -67,14 +124,43 @@ class ConnectionManager:
 manager = ConnectionManager()
 
 
-def image_to_base64(image) -> str:
+async def image_to_base64(image) -> str:
     """Convert PIL image to base64"""
+    if image_executor:
+        return await image_executor.encode_base64(image)
     buffer = BytesIO()
     image.save(buffer, format='PNG')
     return base64.b64encode(buffer.getvalue()).decode('utf-8')
 
 
-async def execute_task(instruction: str, max_steps: int = 10):
+preview = PreviewEncoder(image_to_base64)
+# Deltas are computed against the previous frame, so frames must be
+# encoded and sent one at a time to reach clients in order
+preview_lock = asyncio.Lock()
+
+
+async def broadcast_preview(image, step: int):
+    """Send each client the screen tiles that changed since its last frame"""
+    async with preview_lock:
+        messages = await preview.encode_frame(image, list(manager.connections))
+        for ws, message in messages.items():
+            message["step"] = step
+            try:
+                await ws.send_json(message)
+            except Exception:
+                # Client may have missed tiles; resync with a keyframe
+                preview.forget(ws)
+
+
+def get_device() -> ADBController:
+    """Server-wide controller for the default device"""
+    global adb_controller
+    if adb_controller is None:
+        adb_controller = ADBController(image_executor=image_executor)
+    return adb_controller
+
+
+async def execute_task(instruction: str, max_steps: int = 10, speculative: bool = False):
     """Execute automation task"""
     global current_task, results
 
@@ -87,12 +173,15 @@ async def execute_task(instruction: str, max_steps: int = 10):
     }
 
     # Initialize device and agent
-    device = ADBController()
+    device = get_device()
     agent = MAIAgent(
         llm_base_url="http://127.0.0.1:8000/v1",
-        model_name="default"
+        model_name="default",
+        image_executor=image_executor,
+        grounding_stats=grounding_stats
     )
     agent.reset(goal=instruction, task_id=task_id)
+    speculation = SpeculationStats()
 
     # Notify start
     await manager.broadcast({
@@ -108,6 +197,7 @@ async def execute_task(instruction: str, max_steps: int = 10):
             "message": "Failed to connect to Android device. Check ADB connection."
         })
         current_task["status"] = "error"
+        await agent.close()
         return
 
     await manager.broadcast({
@@ -119,22 +209,33 @@ async def execute_task(instruction: str, max_steps: int = 10):
         }
     })
 
+    # Screenshot and committed prediction carried over from a speculative step
+    screenshot = None
+    proposal = None
+
     # Execute steps
     for step_num in range(max_steps):
         try:
             # Take screenshot
-            screenshot = await device.screenshot()
-            screenshot_b64 = image_to_base64(screenshot)
+            if screenshot is None:
+                screenshot = await device.screenshot()
 
-            # Send screenshot to frontend
-            await manager.broadcast({
-                "type": "screenshot",
-                "step": step_num,
-                "image": screenshot_b64
-            })
+            # Send changed screen tiles to frontend
+            await broadcast_preview(screenshot, step_num)
 
             # Get action from agent
-            response, action = agent.predict(instruction, screenshot)
+            if step_num == 0 and is_click_instruction(instruction):
+                response, action = await ground_click(device, agent, instruction, screenshot)
+            else:
+                # Dump the view hierarchy while the model runs, to snap clicks
+                hierarchy = asyncio.create_task(prefetch_hierarchy(device, screenshot))
+                if proposal:
+                    response, action = proposal
+                else:
+                    # Runs in a thread so other tasks progress during the model call
+                    response, action = await asyncio.to_thread(agent.predict, instruction, screenshot)
+                if action.get("action") == "click":
+                    agent.refine_click(action, await hierarchy)
 
             step_data = {
                 "step": step_num,
@@ -172,11 +273,19 @@ async def execute_task(instruction: str, max_steps: int = 10):
                 })
                 break
 
+            # A prediction after the final step could never be used
+            if speculative and step_num < max_steps - 1:
+                screenshot, proposal = await execute_speculative(
+                    device, agent, instruction, action, speculation
+                )
+                continue
+
             # Execute action on device
             await execute_action(device, action)
 
             # Wait for UI to respond
-            await asyncio.sleep(1.5)
+            await asyncio.sleep(SETTLE_DELAY)
+            screenshot = None
 
         except Exception as e:
             await manager.broadcast({
@@ -185,16 +294,144 @@ async def execute_task(instruction: str, max_steps: int = 10):
             })
             break
 
+    await agent.close()
+
     current_task["status"] = "completed"
+    current_task["grounding"] = grounding_stats.report()
+    current_task["speculation"] = speculation.report()
     results.append(current_task.copy())
 
     await manager.broadcast({
         "type": "task_end",
         "task_id": task_id,
-        "total_steps": len(current_task["steps"])
+        "total_steps": len(current_task["steps"]),
+        "grounding": current_task["grounding"],
+        "speculation": current_task["speculation"]
     })
 
 
+async def prefetch_hierarchy(device: ADBController, screenshot):
+    """View hierarchy for screenshot, or None if it cannot be dumped"""
+    try:
+        return await device.ui_hierarchy(screenshot)
+    except Exception:
+        return None
+
+
+async def ground_click(
+    device: ADBController,
+    agent: MAIAgent,
+    instruction: str,
+    screenshot
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Resolve a click instruction by grounding, trying the accessibility tree
+    before the model. Falls back to navigation if nothing is found.
+    """
+    start = time.perf_counter()
+    hierarchy = await prefetch_hierarchy(device, screenshot)
+    grounding_stats.tree_time += time.perf_counter() - start
+
+    response, coords = await asyncio.to_thread(agent.ground, instruction, screenshot, hierarchy)
+    if coords is None:
+        return await asyncio.to_thread(agent.predict, instruction, screenshot)
+
+    action = {"action": "click", "coordinates": list(coords)}
+    agent.commit(screenshot, response, action)
+    return response, action
+
+
+def frames_match(early, settled) -> bool:
+    """
+    Whether settled shows the same screen as early, ignoring the status bar,
+    blinking text cursors and a few noisy pixels.
+    """
+    if early.size != settled.size:
+        return False
+    w, h = early.size
+    top = int(h * SPECULATION_STATUS_BAR)
+    diff = ImageChops.difference(early.convert("L"), settled.convert("L")).crop((0, top, w, h))
+    mask = diff.point(lambda v: 255 if v > SPECULATION_PIXEL_TOLERANCE else 0)
+    changed_area = mask.getbbox()
+    if changed_area is None:
+        return True
+
+    for box in tile_grid(mask.size, SPECULATION_TILE):
+        if (box[2] <= changed_area[0] or box[0] >= changed_area[2]
+                or box[3] <= changed_area[1] or box[1] >= changed_area[3]):
+            continue
+        tile = mask.crop(box)
+        bbox = tile.getbbox()
+        if bbox is None:
+            continue
+        if tile.histogram()[255] <= SPECULATION_NOISE_PIXELS:
+            continue
+        if bbox[2] - bbox[0] <= SPECULATION_CURSOR_WIDTH:
+            continue
+        return False
+    return True
+
+
+async def execute_speculative(
+    device: ADBController,
+    agent: MAIAgent,
+    instruction: str,
+    action: Dict[str, Any],
+    stats: SpeculationStats
+) -> Tuple[Any, Optional[Tuple[str, Dict[str, Any]]]]:
+    """
+    Execute action and predict the next step while the UI settles.
+
+    The prediction is made on an early post-action frame and kept only if
+    the settled frame matches it (see frames_match).
+
+    Returns:
+        (settled screenshot, committed (response, action) or None)
+    """
+    await execute_action(device, action)
+    await asyncio.sleep(SPECULATION_DELAY)
+
+    early = await device.screenshot()
+    started = time.monotonic()
+    finished_at = None
+
+    async def timed_propose() -> Tuple[str, Dict[str, Any]]:
+        nonlocal finished_at
+        result = await agent.propose_async(instruction, early)
+        finished_at = time.monotonic()
+        return result
+
+    task = asyncio.create_task(timed_propose())
+    try:
+        await asyncio.sleep(max(SETTLE_DELAY - SPECULATION_DELAY, 0))
+        settled = await device.screenshot()
+        settled_at = time.monotonic()
+        stats.attempts += 1
+
+        if not frames_match(early, settled):
+            return settled, None
+
+        response, next_action = await task
+    finally:
+        # Aborts the in-flight request on a miss or error, and waits for it
+        # so it never overlaps with the re-issued prediction
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    if next_action.get("action") == "error":
+        return settled, None
+
+    # Without speculation the model call would have started at settled_at
+    stats.hits += 1
+    stats.latency_saved += min(finished_at, settled_at) - started
+    agent.commit(settled, response, next_action)
+    return settled, (response, next_action)
+
+
 async def execute_action(device: ADBController, action: Dict[str, Any]):
     """Execute action on device"""
     action_type = action.get("action", "")
@@ -245,10 +482,11 @@ async def websocket_endpoint(ws: WebSocket):
             if data.get("type") == "execute":
                 instruction = data.get("instruction", "")
                 max_steps = data.get("max_steps", 10)
+                speculative = bool(data.get("speculative", False))
 
                 if instruction:
                     # Run task in background
-                    asyncio.create_task(execute_task(instruction, max_steps))
+                    asyncio.create_task(execute_task(instruction, max_steps, speculative))
                 else:
                     await ws.send_json({
                         "type": "error",
@@ -260,6 +498,7 @@ async def websocket_endpoint(ws: WebSocket):
 
     except WebSocketDisconnect:
         manager.disconnect(ws)
+        preview.forget(ws)
 
 
 @app.get("/")
@@ -279,7 +518,9 @@ async def get_status():
     """Get current status"""
     return {
         "current_task": current_task,
-        "total_results": len(results)
+        "total_results": len(results),
+        "grounding": grounding_stats.report(),
+        "preview": preview.stats.report()
     }
 
 
@@ -0,0 +1,167 @@
+"""
+Delta-tile live preview
+
+Frames are split into fixed-size tiles and hashed. Each client only gets
+the tiles that changed since the last frame it was sent, plus a full
+keyframe when it first connects, when the frame size changes, when more
+than KEYFRAME_CHANGED_FRACTION of the tiles changed, and every
+KEYFRAME_INTERVAL frames.
+"""
+
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+
+# Tile edge length in pixels
+TILE_SIZE = 128
+
+# Frames between forced keyframes for each client
+KEYFRAME_INTERVAL = 30
+
+# Above this fraction of changed tiles one full frame is cheaper to encode
+# and send than the separate tiles
+KEYFRAME_CHANGED_FRACTION = 0.5
+
+
+@dataclass
+class ClientState:
+    """What a single client has on its canvas"""
+    size: Tuple[int, int]
+    hashes: List[bytes]
+    frames_since_keyframe: int = 0
+
+
+@dataclass
+class PreviewStats:
+    """Preview traffic counters, per client frame"""
+    frames_sent: int = 0
+    frames_skipped: int = 0
+    keyframes: int = 0
+    bytes_sent: int = 0
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "frames_sent": self.frames_sent,
+            "frames_skipped": self.frames_skipped,
+            "keyframes": self.keyframes,
+            "bytes_sent": self.bytes_sent,
+            "avg_bytes_per_sent_frame": (
+                self.bytes_sent // self.frames_sent if self.frames_sent else 0
+            ),
+        }
+
+
+def tile_grid(size: Tuple[int, int], tile_size: int = TILE_SIZE) -> List[Tuple[int, int, int, int]]:
+    """Tile boxes (left, upper, right, lower) covering an image, row by row"""
+    w, h = size
+    return [
+        (x, y, min(x + tile_size, w), min(y + tile_size, h))
+        for y in range(0, h, tile_size)
+        for x in range(0, w, tile_size)
+    ]
+
+
+def tile_hashes(image: Image.Image, boxes: List[Tuple[int, int, int, int]]) -> List[bytes]:
+    """Content hash of each tile"""
+    return [
+        hashlib.blake2b(image.crop(box).tobytes(), digest_size=16).digest()
+        for box in boxes
+    ]
+
+
+class PreviewEncoder:
+    """
+    Per-client delta encoder for screen previews.
+
+    Args:
+        encode: Coroutine turning a PIL image into base64 PNG
+        tile_size: Tile edge length in pixels
+        keyframe_interval: Frames between forced keyframes
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[Image.Image], Awaitable[str]],
+        tile_size: int = TILE_SIZE,
+        keyframe_interval: int = KEYFRAME_INTERVAL,
+    ):
+        self.encode = encode
+        self.tile_size = tile_size
+        self.keyframe_interval = keyframe_interval
+        self.clients: Dict[Any, ClientState] = {}
+        self.stats = PreviewStats()
+
+    def forget(self, client: Any) -> None:
+        """Drop client state so its next frame is a keyframe"""
+        self.clients.pop(client, None)
+
+    async def encode_frame(self, image: Image.Image, clients: List[Any]) -> Dict[Any, Dict[str, Any]]:
+        """
+        Build one preview message per client for a new frame.
+
+        Clients with nothing changed get no message. Each changed tile (and
+        the keyframe) is encoded at most once, however many clients need it.
+        """
+        boxes = tile_grid(image.size, self.tile_size)
+        hashes = await asyncio.to_thread(tile_hashes, image, boxes)
+
+        plans: Dict[Any, Optional[List[int]]] = {}
+        needed = set()
+        for client in clients:
+            state = self.clients.get(client)
+            if (
+                state is None
+                or state.size != image.size
+                or state.frames_since_keyframe >= self.keyframe_interval
+            ):
+                plans[client] = None
+                self.clients[client] = ClientState(size=image.size, hashes=hashes)
+                continue
+
+            changed = [i for i, h in enumerate(hashes) if h != state.hashes[i]]
+            if len(changed) > len(hashes) * KEYFRAME_CHANGED_FRACTION:
+                plans[client] = None
+                self.clients[client] = ClientState(size=image.size, hashes=hashes)
+                continue
+
+            state.hashes = hashes
+            state.frames_since_keyframe += 1
+            if changed:
+                plans[client] = changed
+                needed.update(changed)
+            else:
+                self.stats.frames_skipped += 1
+
+        keyframe_job = None
+        if any(plan is None for plan in plans.values()):
+            keyframe_job = self.encode(image)
+        order = sorted(needed)
+        tile_jobs = [self.encode(image.crop(boxes[i])) for i in order]
+        encoded = await asyncio.gather(*tile_jobs, *([keyframe_job] if keyframe_job else []))
+        tiles = dict(zip(order, encoded))
+        keyframe_b64 = encoded[-1] if keyframe_job else None
+
+        messages = {}
+        for client, plan in plans.items():
+            if plan is None:
+                payload = [{"x": 0, "y": 0, "image": keyframe_b64}]
+                self.stats.keyframes += 1
+            else:
+                payload = [
+                    {"x": boxes[i][0], "y": boxes[i][1], "image": tiles[i]}
+                    for i in plan
+                ]
+            messages[client] = {
+                "type": "preview",
+                "keyframe": plan is None,
+                "width": image.size[0],
+                "height": image.size[1],
+                "tiles": payload,
+            }
+            self.stats.frames_sent += 1
+            self.stats.bytes_sent += sum(len(tile["image"]) for tile in payload)
+        return messages